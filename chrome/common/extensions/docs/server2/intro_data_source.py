@@ -2,6 +2,7 @@
 # Use of this source code is governed by a BSD-style license that can be
 # found in the LICENSE file.
 
+from collections import OrderedDict
 from HTMLParser import HTMLParser
 import logging
 import os
@@ -14,49 +15,80 @@ from third_party.handlebar import Handlebar
 # TODO(kalman): rename this HTMLDataSource or other, then have separate intro
 # article data sources created as instances of it.
 
-_H1_REGEX = re.compile('<h1[^>.]*?>.*?</h1>', flags=re.DOTALL)
+# Matches either an HTML comment, <script> or <style> element, so that headings
+# inside them are skipped, or a single <h1>, <h2> or <h3> element, capturing the
+# tag name, its attributes and its inner HTML. Only attribute values quoted
+# directly after '=' may contain a '>'. A heading that is never closed is
+# skipped rather than swallowing the heading after it.
+_HEADING_REGEX = re.compile(
+    r'<!--.*?-->|'
+    r'<script\b.*?</script\s*>|'
+    r'<style\b.*?</style\s*>|'
+    r'''<(h[123])\b((?:[^>=]|=(?:\s*"[^"]*"|\s*'[^']*')?)*)>'''
+    r'((?:(?!<h[123]\b).)*?)</\1\s*>',
+    flags=re.DOTALL | re.IGNORECASE)
+# Matches a single attribute, capturing its name and its double quoted, single
+# quoted or unquoted value.
+_ATTR_REGEX = re.compile(
+    r'''([^\s=]+)(?:\s*=\s*(?:"([^"]*)"|'([^']*)'|(\S*)))?''')
+_UnescapeHtml = HTMLParser().unescape
+_TAG_REGEX = re.compile('<[^>]+>')
+# The heading level for every tag name _HEADING_REGEX can capture.
+_HEADING_LEVELS = {'h1': 1, 'h2': 2, 'h3': 3, 'H1': 1, 'H2': 2, 'H3': 3}
 
-class _IntroParser(HTMLParser):
-  ''' An HTML parser which will parse table of contents and page title info out
-  of an intro.
+# The number of parsed intros IntroDataSource.Factory keeps in memory.
+_MAX_PARSED_INTROS = 256
+
+def _StripTags(html):
+  # Most headings are plain text, and a substring check is much cheaper than
+  # running the regex over them.
+  if '<' not in html:
+    return html
+  return _TAG_REGEX.sub('', html)
+
+def _GetId(attrs):
+  '''Returns the unescaped value of the id attribute in |attrs|, or '' if there
+  isn't one.
   '''
-  def __init__(self):
-    HTMLParser.__init__(self)
-    self.toc = []
-    self.page_title = None
-    self._recent_tag = None
-    self._current_heading = {}
-
-  def handle_starttag(self, tag, attrs):
-    id_ = ''
-    if tag not in ['h1', 'h2', 'h3']:
-      return
-    if tag != 'h1' or self.page_title is None:
-      self._recent_tag = tag
-    for attr in attrs:
-      if attr[0] == 'id':
-        id_ = attr[1]
-    if tag == 'h2':
-      self._current_heading = { 'link': id_, 'subheadings': [], 'title': '' }
-      self.toc.append(self._current_heading)
-    elif tag == 'h3':
-      self._current_heading = { 'link': id_, 'title': '' }
-      self.toc[-1]['subheadings'].append(self._current_heading)
-
-  def handle_endtag(self, tag):
-    if tag in ['h1', 'h2', 'h3']:
-      self._recent_tag = None
-
-  def handle_data(self, data):
-    if self._recent_tag is None:
-      return
-    if self._recent_tag == 'h1':
-      if self.page_title is None:
-        self.page_title = data
-      else:
-        self.page_title += data
-    elif self._recent_tag in ['h2', 'h3']:
-      self._current_heading['title'] += data
+  for name, double_quoted, single_quoted, unquoted in (
+      _ATTR_REGEX.findall(attrs)):
+    if name.lower() == 'id':
+      value = double_quoted or single_quoted or unquoted
+      return _UnescapeHtml(value) if '&' in value else value
+  return ''
+
+def _FindTitleHeading(html):
+  '''Returns the match for the first <h1> in |html|, the heading _ParseIntro
+  takes the page title from, or None if there isn't one.
+  '''
+  for match in _HEADING_REGEX.finditer(html):
+    if _HEADING_LEVELS.get(match.group(1)) == 1:
+      return match
+  return None
+
+def _ParseIntro(html):
+  '''Scans |html| for headings, returning a tuple of the page title (the text
+  of the first <h1>) and the table of contents built from the <h2> and <h3>
+  headings.
+  '''
+  page_title = None
+  toc = []
+  for tag, attrs, content in _HEADING_REGEX.findall(html):
+    if not tag:
+      # A comment, script or style.
+      continue
+    level = _HEADING_LEVELS[tag]
+    if level == 1:
+      if page_title is None:
+        page_title = _StripTags(content)
+      continue
+    title = _StripTags(content)
+    id_ = _GetId(attrs) if attrs else ''
+    if level == 2:
+      toc.append({ 'link': id_, 'subheadings': [], 'title': title })
+    elif toc:
+      toc[-1]['subheadings'].append({ 'link': id_, 'title': title })
+  return page_title, toc
 
 class IntroDataSource(object):
   '''This class fetches the intros for a given API. From this intro, a table
@@ -68,51 +100,88 @@ class IntroDataSource(object):
                                                IntroDataSource)
       self._ref_resolver = ref_resolver_factory.Create()
       self._base_paths = base_paths
+      # Maps (api name, intro content) to the intro dict built from it, so that
+      # identical intros found under different paths, or refetched with an
+      # unchanged body after their version changes, are only parsed once. The
+      # oldest entries are evicted first.
+      self._parsed_intros = OrderedDict()
+      # Maps keys to the candidate paths for that key, shared between every
+      # IntroDataSource this creates.
+      self._intro_paths = {}
 
     def _MakeIntroDict(self, intro_path, intro):
       # Guess the name of the API from the path to the intro.
       api_name = os.path.splitext(intro_path.split('/')[-1])[0]
+      intro_dict = self._parsed_intros.get((api_name, intro))
+      if intro_dict is None:
+        intro_dict = self._ParseIntroDict(api_name, intro)
+        if len(self._parsed_intros) >= _MAX_PARSED_INTROS:
+          self._parsed_intros.popitem(last=False)
+        self._parsed_intros[(api_name, intro)] = intro_dict
+      return intro_dict
+
+    def _ParseIntroDict(self, api_name, intro):
       intro_with_links = self._ref_resolver.ResolveAllLinks(intro,
                                                             namespace=api_name)
-      apps_parser = _IntroParser()
-      apps_parser.feed(Handlebar(intro_with_links).render(
-          { 'is_apps': True }).text)
-      extensions_parser = _IntroParser()
-      extensions_parser.feed(Handlebar(intro_with_links).render(
-          { 'is_apps': False }).text)
+      intro_template = Handlebar(intro_with_links)
+      apps_html = intro_template.render({ 'is_apps': True }).text
+      extensions_html = intro_template.render({ 'is_apps': False }).text
+      apps_title, apps_toc = _ParseIntro(apps_html)
+      # Most intros don't branch on is_apps, so don't scan the same HTML twice.
+      if extensions_html == apps_html:
+        extensions_title, extensions_toc = apps_title, apps_toc
+      else:
+        extensions_title, extensions_toc = _ParseIntro(extensions_html)
       # TODO(cduvall): Use the normal template rendering system, so we can check
       # errors.
-      if extensions_parser.page_title != apps_parser.page_title:
+      if extensions_title != apps_title:
         logging.error(
             'Title differs for apps and extensions: Apps: %s, Extensions: %s.' %
-                (extensions_parser.page_title, apps_parser.page_title))
+                (extensions_title, apps_title))
       # The templates will render the heading themselves, so remove it from the
       # HTML content.
-      intro_with_links = re.sub(_H1_REGEX, '', intro_with_links, count=1)
+      h1_match = _FindTitleHeading(intro_with_links)
+      if h1_match is not None:
+        intro_with_links = (intro_with_links[:h1_match.start()] +
+                            intro_with_links[h1_match.end():])
       return {
         'intro': Handlebar(intro_with_links),
-        'title': apps_parser.page_title,
-        'apps_toc': apps_parser.toc,
-        'extensions_toc': extensions_parser.toc,
+        'title': apps_title,
+        'apps_toc': apps_toc,
+        'extensions_toc': extensions_toc,
       }
 
     def Create(self):
-      return IntroDataSource(self._cache, self._base_paths)
+      return IntroDataSource(self._cache, self._base_paths, self._intro_paths)
 
-  def __init__(self, cache, base_paths):
+  def __init__(self, cache, base_paths, intro_paths):
     self._cache = cache
     self._base_paths = base_paths
+    self._intro_paths = intro_paths
+    # Templates look up several fields of the same intro, so remember each
+    # result for the lifetime of this data source.
+    self._intro_dicts = {}
 
   def get(self, key):
-    path = FormatKey(key)
-    def get_from_base_path(base_path):
-      return self._cache.GetFromFile('%s/%s' % (base_path, path))
-    for base_path in self._base_paths:
+    intro_dict = self._intro_dicts.get(key)
+    if intro_dict is None:
+      intro_dict = self._GetUncached(key)
+      self._intro_dicts[key] = intro_dict
+    return intro_dict
+
+  def _GetUncached(self, key):
+    paths = self._intro_paths.get(key)
+    if paths is None:
+      path = FormatKey(key)
+      paths = ['%s/%s' % (base_path, path) for base_path in self._base_paths]
+      self._intro_paths[key] = paths
+    # Always try the base paths in order, since earlier ones take precedence.
+    for path in paths:
       try:
-        return get_from_base_path(base_path)
+        return self._cache.GetFromFile(path)
       except FileNotFoundError:
         continue
     # Not found. Do the first operation again so that we get a stack trace - we
     # know that it'll fail.
-    get_from_base_path(self._base_paths[0])
+    self._cache.GetFromFile(paths[0])
     raise AssertionError()
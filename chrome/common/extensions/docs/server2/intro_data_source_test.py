@@ -3,11 +3,22 @@
 # Use of this source code is governed by a BSD-style license that can be
 # found in the LICENSE file.
 
+from file_system import FileNotFoundError
+from intro_data_source import IntroDataSource, _ParseIntro
 from server_instance import ServerInstance
 from test_data.canned_data import CANNED_TEST_FILE_SYSTEM_DATA
 from test_file_system import TestFileSystem
 import unittest
 
+class _FakeCache(object):
+  def __init__(self, files):
+    self.files = files
+
+  def GetFromFile(self, path):
+    if path not in self.files:
+      raise FileNotFoundError(path)
+    return self.files[path]
+
 class IntroDataSourceTest(unittest.TestCase):
   def setUp(self):
     self._server = ServerInstance.ForTest(
@@ -27,5 +38,89 @@ class IntroDataSourceTest(unittest.TestCase):
     self.assertEqual('you<h2>first</h2><h3>inner</h3><h2>second</h2>',
                      data['intro'].render().text)
 
+  def testBasePathPrecedence(self):
+    cache = _FakeCache({'articles/a.html': 'article a'})
+    intro_paths = {}
+    def create():
+      return IntroDataSource(cache, ['intros', 'articles'], intro_paths)
+    self.assertEqual('article a', create().get('a'))
+    # Once an intro appears under the first base path, it takes precedence even
+    # though the key was previously served from a later one.
+    cache.files['intros/a.html'] = 'intro a'
+    self.assertEqual('intro a', create().get('a'))
+    self.assertRaises(FileNotFoundError, create().get, 'b')
+
+  def testIdenticalIntrosParsedOnce(self):
+    factory = self._server.intro_data_source_factory
+    intro = '<h1>hi</h1>you<h2>first</h2>'
+    intro_dict = factory._MakeIntroDict('intros/test.html', intro)
+    self.assertTrue(
+        intro_dict is factory._MakeIntroDict('articles/test.html', intro))
+    self.assertFalse(
+        intro_dict is factory._MakeIntroDict('intros/test.html', intro + ' '))
+
+  def testTitleHeadingStripped(self):
+    factory = self._server.intro_data_source_factory
+    intro_dict = factory._MakeIntroDict(
+        'intros/test.html',
+        'a<!-- <h1>old</h1> --><h1x>b</h1x><H1 class="t">T</H1 >c')
+    self.assertEqual('T', intro_dict['title'])
+    self.assertEqual('a<!-- <h1>old</h1> --><h1x>b</h1x>c',
+                     intro_dict['intro'].render().text)
+
+  def testParseIntro(self):
+    title, toc = _ParseIntro(
+        '<h1 class="page">The <code>API</code></h1>text'
+        '<h2 id="one">One</h2><h3 id=\'a\'>A <b>bold</b> move</h3>'
+        '<H2 ID="two">Two</H2><h1>ignored</h1>')
+    self.assertEqual('The API', title)
+    self.assertEqual([{'link': 'one',
+                       'subheadings': [{'link': 'a', 'title': 'A bold move'}],
+                       'title': 'One'},
+                      {'link': 'two', 'subheadings': [], 'title': 'Two'}],
+                     toc)
+
+  def testParseIntroAttributes(self):
+    title, toc = _ParseIntro(
+        '<h1>t</h1>'
+        '<h2 data-id="bad" id="good">X</h2>'
+        '<h2 id=foo>Y</h2>'
+        '<h2 class="a>b" id="y">Z</h2>')
+    self.assertEqual('t', title)
+    self.assertEqual([{'link': 'good', 'subheadings': [], 'title': 'X'},
+                      {'link': 'foo', 'subheadings': [], 'title': 'Y'},
+                      {'link': 'y', 'subheadings': [], 'title': 'Z'}],
+                     toc)
+
+  def testParseIntroAttributeEdgeCases(self):
+    # An apostrophe in an unquoted value doesn't start a quoted value, and ids
+    # are unescaped.
+    title, toc = _ParseIntro(
+        '<h2 class=don\'t>A</h2><h2 id="b">B</h2><h2 id="a&amp;b">C</h2>')
+    self.assertEqual(None, title)
+    self.assertEqual([{'link': '', 'subheadings': [], 'title': 'A'},
+                      {'link': 'b', 'subheadings': [], 'title': 'B'},
+                      {'link': 'a&b', 'subheadings': [], 'title': 'C'}],
+                     toc)
+
+  def testParseIntroUnclosedHeading(self):
+    # A heading that is never closed is dropped, and doesn't swallow the
+    # heading after it.
+    title, toc = _ParseIntro('<h2>A<h2 id="b">B</h2>')
+    self.assertEqual([{'link': 'b', 'subheadings': [], 'title': 'B'}], toc)
+
+  def testParseIntroSkipsScripts(self):
+    title, toc = _ParseIntro(
+        '<script>document.write("<h2>s</h2>");</script>'
+        '<style>/* <h2>t</h2> */</style><h2>d</h2>')
+    self.assertEqual([{'link': '', 'subheadings': [], 'title': 'd'}], toc)
+
+  def testParseIntroSkipsComments(self):
+    title, toc = _ParseIntro(
+        '<!-- <h1>old</h1> --><h1>new</h1>'
+        '<!-- <h2>c</h2> --><h2>d</h2>')
+    self.assertEqual('new', title)
+    self.assertEqual([{'link': '', 'subheadings': [], 'title': 'd'}], toc)
+
 if __name__ == '__main__':
   unittest.main()
@@ -32,8 +32,21 @@ def GetLatestRevision(site=Site.CONTINUOUS):
   return urllib.urlopen(url % _GetDownloadPlatform()).read()
 
 
-def DownloadChrome(revision, dest_dir, site=Site.CONTINUOUS):
-  """Downloads the packaged Chrome from the archive to the given directory.
+def GetChromeZipUrl(revision, site=Site.CONTINUOUS):
+  """Returns the URL of the packaged Chrome for the given revision.
+
+  Args:
+    revision: the revision of Chrome.
+    site: the archive site to download from, default to the continuous one.
+  """
+  return site + '/%s/%s/%s.zip' % (_GetDownloadPlatform(), revision,
+                                   _GetZipName())
+
+
+def DownloadChromeZip(revision, dest_dir, site=Site.CONTINUOUS):
+  """Downloads the packaged Chrome from the archive without unzipping it.
+
+  Nothing is written to stdout, so this is safe to call on a worker thread.
 
   Args:
     revision: the revision of Chrome to download.
@@ -41,30 +54,44 @@ def DownloadChrome(revision, dest_dir, site=Site.CONTINUOUS):
     site: the archive site to download from, default to the continuous one.
 
   Returns:
-    The path to the unzipped Chrome binary.
+    The path to the downloaded zip file.
   """
-  def GetZipName():
-    if util.IsWindows():
-      return 'chrome-win32'
-    elif util.IsMac():
-      return 'chrome-mac'
-    elif util.IsLinux():
-      return 'chrome-linux'
-  def GetChromePathFromPackage():
-    if util.IsWindows():
-      return 'chrome.exe'
-    elif util.IsMac():
-      return 'Chromium.app/Contents/MacOS/Chromium'
-    elif util.IsLinux():
-      return 'chrome'
   zip_path = os.path.join(dest_dir, 'chrome-%s.zip' % revision)
   if not os.path.exists(zip_path):
-    url = site + '/%s/%s/%s.zip' % (_GetDownloadPlatform(), revision,
-                                    GetZipName())
-    print 'Downloading', url, '...'
-    urllib.urlretrieve(url, zip_path)
+    urllib.urlretrieve(GetChromeZipUrl(revision, site), zip_path)
+  return zip_path
+
+
+def UnzipChrome(zip_path, dest_dir):
+  """Unzips a packaged Chrome fetched by DownloadChromeZip.
+
+  Args:
+    zip_path: the path to the zip file.
+    dest_dir: the directory to unzip Chrome to.
+
+  Returns:
+    The path to the unzipped Chrome binary.
+  """
   util.Unzip(zip_path, dest_dir)
-  return os.path.join(dest_dir, GetZipName(), GetChromePathFromPackage())
+  return os.path.join(dest_dir, _GetZipName(), _GetChromePathFromPackage())
+
+
+def _GetZipName():
+  if util.IsWindows():
+    return 'chrome-win32'
+  elif util.IsMac():
+    return 'chrome-mac'
+  elif util.IsLinux():
+    return 'chrome-linux'
+
+
+def _GetChromePathFromPackage():
+  if util.IsWindows():
+    return 'chrome.exe'
+  elif util.IsMac():
+    return 'Chromium.app/Contents/MacOS/Chromium'
+  elif util.IsLinux():
+    return 'chrome'
 
 
 def _GetDownloadPlatform():
@@ -5,6 +5,7 @@
 
 """Runs all ChromeDriver end to end tests."""
 
+from multiprocessing.pool import ThreadPool
 import optparse
 import os
 import platform
@@ -17,12 +18,20 @@ import archive
 import chrome_paths
 import util
 
+_PY_TESTS_SCRIPT = os.path.join(_THIS_DIR, 'run_py_tests.py')
+_JAVA_TESTS_SCRIPT = os.path.join(_THIS_DIR, 'run_java_tests.py')
+# The number of Chrome builds fetched in the background at once, kept low so
+# the downloads don't compete with the browser tests that are running.
+_MAX_PARALLEL_DOWNLOADS = 1
+# How long to wait for a single Chrome download before giving up.
+_DOWNLOAD_TIMEOUT_SECS = 60 * 60
+
 
 def _AppendEnvironmentPath(env_name, path):
   if env_name in os.environ:
-    lib_path = os.environ[env_name]
-    if path not in lib_path:
-      os.environ[env_name] += os.pathsep + path
+    components = os.environ[env_name].split(os.pathsep)
+    if path not in components:
+      os.environ[env_name] = os.pathsep.join(components + [path])
   else:
     os.environ[env_name] = path
 
@@ -31,9 +40,10 @@ def _AddToolsToSystemPathForWindows():
   path_cfg_file = 'C:\\tools\\bots_path.cfg'
   if not os.path.exists(path_cfg_file):
     print 'Failed to find file', path_cfg_file
+    return
   with open(path_cfg_file, 'r') as cfg:
-    paths = cfg.read().split('\n')
-  os.environ['PATH'] = os.pathsep.join(paths) + os.pathsep + os.environ['PATH']
+    paths = [line.rstrip('\r\n') for line in cfg if line.strip()]
+  os.environ['PATH'] = os.pathsep.join(paths + [os.environ['PATH']])
 
 
 def _GenerateTestCommand(script,
@@ -44,7 +54,7 @@ def _GenerateTestCommand(script,
                          android_package=None):
   cmd = [
       sys.executable,
-      os.path.join(_THIS_DIR, script),
+      script,
       '--chromedriver=' + chromedriver,
   ]
   if ref_chromedriver:
@@ -68,7 +78,7 @@ def RunPythonTests(chromedriver, ref_chromedriver,
     version_info = '(v%s)' % chrome_version_name
   util.MarkBuildStepStart('python_tests%s' % version_info)
   code = util.RunCommand(
-      _GenerateTestCommand('run_py_tests.py',
+      _GenerateTestCommand(_PY_TESTS_SCRIPT,
                            chromedriver,
                            ref_chromedriver=ref_chromedriver,
                            chrome=chrome,
@@ -86,7 +96,7 @@ def RunJavaTests(chromedriver, chrome=None, chrome_version=None,
     version_info = '(v%s)' % chrome_version_name
   util.MarkBuildStepStart('java_tests%s' % version_info)
   code = util.RunCommand(
-      _GenerateTestCommand('run_java_tests.py',
+      _GenerateTestCommand(_JAVA_TESTS_SCRIPT,
                            chromedriver,
                            ref_chromedriver=None,
                            chrome=chrome,
@@ -105,9 +115,33 @@ def RunCppTests(cpp_tests):
   return code
 
 
-def DownloadChrome(version_name, revision, download_site):
+def StartDownloadingChrome(pool, revision, download_site):
+  """Starts downloading the Chrome zip on |pool|.
+
+  Only the silent download runs on |pool|; logging and unzipping are left to
+  WaitForChromeDownload so that their output lands in the download step.
+
+  Returns:
+    A (url, dest_dir, pending zip path) tuple to pass to WaitForChromeDownload.
+  """
+  dest_dir = util.MakeTempDir()
+  return (archive.GetChromeZipUrl(revision, download_site),
+          dest_dir,
+          pool.apply_async(archive.DownloadChromeZip,
+                           (revision, dest_dir, download_site)))
+
+
+def WaitForChromeDownload(version_name, download):
+  """Waits for a download from StartDownloadingChrome and unzips it.
+
+  Returns:
+    The path to the unzipped Chrome binary.
+  """
   util.MarkBuildStepStart('download %s' % version_name)
-  return archive.DownloadChrome(revision, util.MakeTempDir(), download_site)
+  url, dest_dir, zip_path = download
+  util.PrintAndFlush('Downloading %s ...' % url)
+  # AsyncResult.get() without a timeout can't be interrupted by Ctrl-C.
+  return archive.UnzipChrome(zip_path.get(_DOWNLOAD_TIMEOUT_SECS), dest_dir)
 
 
 def main():
@@ -123,8 +157,11 @@ def main():
            'Notice: this option only applies to desktop.')
   options, _ = parser.parse_args()
 
+  is_windows = util.IsWindows()
+  is_linux = util.IsLinux()
+
   exe_postfix = ''
-  if util.IsWindows():
+  if is_windows:
     exe_postfix = '.exe'
   cpp_tests_name = 'chromedriver2_tests' + exe_postfix
   server_name = 'chromedriver2_server' + exe_postfix
@@ -137,7 +174,7 @@ def main():
 
   chromedriver = os.path.join(build_dir, server_name)
   platform_name = util.GetPlatformName()
-  if util.IsLinux() and platform.architecture()[0] == '64bit':
+  if is_linux and platform.architecture()[0] == '64bit':
     platform_name += '64'
   ref_chromedriver = os.path.join(
       chrome_paths.GetSrc(),
@@ -145,11 +182,11 @@ def main():
       'reference_builds',
       'chromedriver_%s%s' % (platform_name, exe_postfix))
 
-  if util.IsLinux():
+  if is_linux:
     # Set LD_LIBRARY_PATH to enable successful loading of shared object files,
     # when chromedriver2.so is not a static build.
     _AppendEnvironmentPath('LD_LIBRARY_PATH', os.path.join(build_dir, 'lib'))
-  elif util.IsWindows():
+  elif is_windows:
     # For Windows bots: add ant, java(jre) and the like to system path.
     _AddToolsToSystemPathForWindows()
 
@@ -170,23 +207,33 @@ def main():
         ['28', archive.CHROME_28_REVISION],
         ['27', archive.CHROME_27_REVISION]
     ]
-    code = 0
+    if options.chrome_version:
+      versions = [version for version in versions
+                  if version[0] == options.chrome_version]
+    # Downloads are independent of each other and of the tests, so fetch the
+    # later versions in the background while the tests for earlier ones run.
+    pool = ThreadPool(_MAX_PARALLEL_DOWNLOADS)
+    downloads = []
     for version in versions:
-      if options.chrome_version and version[0] != options.chrome_version:
-        continue
       download_site = archive.Site.CONTINUOUS
       version_name = version[0]
       if version_name == 'HEAD':
         version_name = version[1]
         download_site = archive.Site.SNAPSHOT
-      chrome_path = DownloadChrome(version_name, version[1], download_site)
+      downloads.append(
+          (version[0], version_name,
+           StartDownloadingChrome(pool, version[1], download_site)))
+    pool.close()
+    code = 0
+    for chrome_version, version_name, download in downloads:
+      chrome_path = WaitForChromeDownload(version_name, download)
       code1 = RunPythonTests(chromedriver,
                              ref_chromedriver,
                              chrome=chrome_path,
-                             chrome_version=version[0],
+                             chrome_version=chrome_version,
                              chrome_version_name=version_name)
       code2 = RunJavaTests(chromedriver, chrome=chrome_path,
-                           chrome_version=version[0],
+                           chrome_version=chrome_version,
                            chrome_version_name=version_name)
       code = code or code1 or code2
     cpp_tests = os.path.join(build_dir, cpp_tests_name)